@@ -2,7 +2,8 @@ from multitaxienv.taxi_environment import TaxiEnv, orig_MAP, MAP2, orig_MAP2, MA
 from TaxiWrapper.taxi_wrapper import *
 from ControllerWrapper.controller_wrapper import Controller
 import matplotlib.pyplot as plt
-import copy
+from multiprocessing import Pool
+import random
 
 
 def no_collaboration_case(taxi_env: TaxiEnv, controller: Controller, taxis: List[Taxi], passenger_index: int):
@@ -16,10 +17,12 @@ def no_collaboration_case(taxi_env: TaxiEnv, controller: Controller, taxis: List
     passenger_location = taxi_env.state[PASSENGERS_START_LOCATION][passenger_index]
     passenger_destination = taxi_env.state[PASSENGERS_DESTINATIONS][passenger_index]
     path_to_destination_cost = controller.env_graph.path_cost(origin=passenger_location, dest=passenger_destination)
+    # The distances of all points from the passenger, used to get the distance of every taxi to the passenger:
+    passenger_distances = controller.env_graph.single_source(passenger_location)
     capable_taxis = []  # list with the indices of the taxis that can bring the passenger to the destination.
     min_dist_from_dest = path_to_destination_cost  # the minimum distance that the passenger can get from the dest.
     for taxi in taxis:
-        path_to_passenger_cost = taxi.path_cost(dest=passenger_location)
+        path_to_passenger_cost = int(passenger_distances[taxi.get_location_flat()])
         total_path_cost = path_to_passenger_cost + path_to_destination_cost
         taxi_fuel = taxi.get_fuel()
         dist_from_dest = max(0, total_path_cost - (taxi_fuel - 1))
@@ -29,6 +32,23 @@ def no_collaboration_case(taxi_env: TaxiEnv, controller: Controller, taxis: List
     return capable_taxis, min_dist_from_dest
 
 
+def transfer_point_h2(controller: Controller, from_taxi_index: int, to_taxi_index: int, passenger_index: int):
+    """
+    Compute the transfer point according to heuristic 2, with the same signature as the other heuristics. The
+    `to_taxi_index` is ignored, as this heuristic doesn't depend on the taxi the passenger is transferred to.
+    """
+    return controller.find_transfer_point_h2(from_taxi_index=from_taxi_index, passenger_index=passenger_index)
+
+
+# The function computing the transfer point for every heuristic `h` of `collaboration_case`. All functions are called
+# as f(controller, from_taxi_index, to_taxi_index, passenger_index):
+TRANSFER_POINT_HEURISTICS = {
+    0: Controller.find_optimal_transfer_point,
+    1: Controller.find_transfer_point_h1,
+    2: transfer_point_h2,
+}
+
+
 def collaboration_case(taxi_env: TaxiEnv, controller: Controller, taxis: List[Taxi], passenger_index: int, h: int):
     """
     Check if the taxis are able to bring the passenger (given by the passenger_index) to the destination,
@@ -57,15 +77,9 @@ def collaboration_case(taxi_env: TaxiEnv, controller: Controller, taxis: List[Ta
 
     # Compute the transfer point according to different heuristics and execute the transfer:
     to_taxi_index = 1 - closest_taxi
-    if h == 1:
-        transfer_point = controller.find_transfer_point_h1(from_taxi_index=closest_taxi, passenger_index=0,
-                                                           to_taxi_index=to_taxi_index)
-    elif h == 2:
-        transfer_point = controller.find_transfer_point_h2(from_taxi_index=closest_taxi, passenger_index=0)
-    else:
-        transfer_point = controller.find_optimal_transfer_point(from_taxi_index=closest_taxi,
-                                                                to_taxi_index=to_taxi_index,
-                                                                passenger_index=passenger_index)
+    find_transfer_point = TRANSFER_POINT_HEURISTICS.get(h, Controller.find_optimal_transfer_point)
+    transfer_point = find_transfer_point(controller, from_taxi_index=closest_taxi, to_taxi_index=to_taxi_index,
+                                         passenger_index=passenger_index)
     controller.transfer_passenger(passenger_index=0, from_taxi_index=closest_taxi, to_taxi_index=to_taxi_index,
                                   transfer_point=transfer_point)
 
@@ -82,50 +96,61 @@ def collaboration_case(taxi_env: TaxiEnv, controller: Controller, taxis: List[Ta
         return 0, remaining_dist_to_dest
 
 
-def reset_env_state(state, env, controller, all_taxis):
+def snapshot_state(state) -> tuple:
+    """
+    Take an immutable snapshot of the environment state, that can be restored later using `reset_env_state`.
+    Only the top level lists of the state are copied. The coordinates inside them are shared with the live state, as
+    the environment never modifies a coordinate in place (a move replaces the coordinate of the taxi).
+    """
+    return tuple(tuple(item) for item in state)
+
+
+def reset_env_state(state_snapshot, env, controller, all_taxis):
     """
-    Reset the environment state to the given state. The reset is done to the each environment held by the controller
-    and taxis.
+    Reset the environment state to the given snapshot (see `snapshot_state`). The controller and all taxis hold the
+    same `env` object, so resetting its state resets the state seen by all of them.
     """
-    env.state = state
-    controller.taxi_env.state = state
-    for taxi in all_taxis:
-        taxi.taxi_env.state = state
+    env.state = [list(item) for item in state_snapshot]
     controller.taxis = all_taxis
 
 
-def collaboration_experiment(test_repetitions: int, num_taxis: int, taxis_fuel: List[int]):
+def collaboration_experiment(test_repetitions: int, num_taxis: int, taxis_fuel: List[int], seed_offset: int = 0):
     """
     This experiment compares the number of successful passenger deliveries and the distance of the passenger from the
     destination when not using taxi-collaboration and when collaboration according to one of the 3 different
     heuristics we examined.
     Args:
-        test_repetitions: the number of times to repeat the test. For every test, a new random environment is
-        initialized.
+        test_repetitions: the number of times to repeat the test. For every test, the environment is reset to a new
+        random state.
         num_taxis: the number of taxis that should be initialized in every test.
         taxis_fuel: a list of size `num_taxis`, where each element is the maximal fuel value for every taxi.
+        seed_offset: test number `i` is generated with the random seed `seed_offset + i`, so experiments with the same
+        offset (e.g. with different fuel values) are run on the same scenarios.
     """
     no_collaboration_success = 0
-    average_dist_no_collaboration = 0
+    total_dist_no_collaboration = 0
     collaboration_h1_success = 0
-    average_dist_h1_collaboration = 0
+    total_dist_h1_collaboration = 0
     collaboration_h2_success = 0
-    average_dist_h2_collaboration = 0
+    total_dist_h2_collaboration = 0
     collaboration_optimal_success = 0
-    average_dist_optimal_collaboration = 0
+    total_dist_optimal_collaboration = 0
 
+    env = TaxiEnv(num_taxis=num_taxis, num_passengers=1, max_fuel=taxis_fuel,
+                  taxis_capacity=None, collision_sensitive_domain=False,
+                  fuel_type_list=None, option_to_stand_by=True, domain_map=MAP3)
+    # The map is the same in all tests, so all taxis and controllers share a single graph of it:
+    env_graph = EnvGraph.for_desc(env.desc)
     for test in range(test_repetitions):
-        env = TaxiEnv(num_taxis=num_taxis, num_passengers=1, max_fuel=taxis_fuel,
-                      taxis_capacity=None, collision_sensitive_domain=False,
-                      fuel_type_list=None, option_to_stand_by=True, domain_map=MAP3)
+        random.seed(seed_offset + test)
         env.reset()
         env.s = 1022
 
         # Initialize a Taxi object for each taxi and a controller:
         all_taxis = []
         for i in range(num_taxis):
-            all_taxis.append(Taxi(env, taxi_index=i))
-        controller = Controller(env, taxis=all_taxis)
+            all_taxis.append(Taxi(env, taxi_index=i, env_graph=env_graph))
+        controller = Controller(env, taxis=all_taxis, env_graph=env_graph)
 
         no_collaboration_results = no_collaboration_case(env, controller, all_taxis, passenger_index=0)
         if no_collaboration_results[
@@ -136,37 +161,37 @@ def collaboration_experiment(test_repetitions: int, num_taxis: int, taxis_fuel:
             collaboration_optimal_success += 1
         else:
             # Add the distance of the passenger to the no_collaboration_average as the passenger didn't arrive at dest.
-            average_dist_no_collaboration += no_collaboration_results[1] / test_repetitions
+            total_dist_no_collaboration += no_collaboration_results[1]
 
-            # copy the env state so the same state can be used for all heuristics:
-            state = copy.deepcopy(env.state)
+            # snapshot the env state so the same state can be used for all heuristics:
+            state = snapshot_state(env.state)
 
             # test heuristic 1
             collaboration_h1_results = collaboration_case(env, controller, all_taxis, passenger_index=0, h=1)
             collaboration_h1_success += collaboration_h1_results[0]
-            average_dist_h1_collaboration += collaboration_h1_results[1] / test_repetitions
+            total_dist_h1_collaboration += collaboration_h1_results[1]
 
             # reset the env to the state before the collaboration test:
             reset_env_state(state, env, controller, all_taxis)
-            state = copy.deepcopy(env.state)
 
             # test heuristic 2
             collaboration_h2_results = collaboration_case(env, controller, all_taxis, passenger_index=0, h=2)
             collaboration_h2_success += collaboration_h2_results[0]
-            average_dist_h2_collaboration += collaboration_h2_results[1] / test_repetitions
+            total_dist_h2_collaboration += collaboration_h2_results[1]
 
             # reset the env to the state before the collaboration test:
             reset_env_state(state, env, controller, all_taxis)
-            state = copy.deepcopy(env.state)
 
             # test the optimal solution
             collaboration_optimal_results = collaboration_case(env, controller, all_taxis, passenger_index=0, h=0)
             collaboration_optimal_success += collaboration_optimal_results[0]
-            average_dist_optimal_collaboration += collaboration_optimal_results[1] / test_repetitions
+            total_dist_optimal_collaboration += collaboration_optimal_results[1]
 
-    return no_collaboration_success, average_dist_no_collaboration, collaboration_h1_success, \
-           average_dist_h1_collaboration, collaboration_h2_success, average_dist_h2_collaboration, \
-           collaboration_optimal_success, average_dist_optimal_collaboration
+    # The distances are accumulated as sums over all tests and averaged only once here:
+    return no_collaboration_success, total_dist_no_collaboration / test_repetitions, collaboration_h1_success, \
+           total_dist_h1_collaboration / test_repetitions, collaboration_h2_success, \
+           total_dist_h2_collaboration / test_repetitions, collaboration_optimal_success, \
+           total_dist_optimal_collaboration / test_repetitions
 
 
 def collaboration_statistics(test_repetitions: int):
@@ -183,8 +208,11 @@ def collaboration_statistics(test_repetitions: int):
     collaboration_h2_dist = []
     collaboration_optimal_successes = []
     collaboration_optimal_dist = []
-    for fuel in fuel_limits:
-        results = collaboration_experiment(test_repetitions=test_repetitions, num_taxis=2, taxis_fuel=[fuel, fuel])
+    # The experiments of the different fuel levels are independent, so run them in parallel:
+    with Pool() as pool:
+        all_results = pool.starmap(collaboration_experiment,
+                                   [(test_repetitions, 2, [fuel, fuel]) for fuel in fuel_limits])
+    for results in all_results:
         no_collaboration_successes.append(results[0] / test_repetitions * 100)
         no_collaboration_dist.append(results[1])
         collaboration_h1_successes.append(results[2] / test_repetitions * 100)
@@ -4,13 +4,14 @@ from TaxiWrapper.taxi_wrapper import FUELS, PASSENGERS_START_LOCATION, PASSENGER
 
 
 class Controller:
-    def __init__(self, taxi_env, taxis):
+    def __init__(self, taxi_env, taxis, env_graph: EnvGraph = None):
         self.taxi_env = taxi_env
         if taxis:
             self.taxis: List[Taxi] = taxis
         else:
             self.taxis = [Taxi(taxi_env, i) for i in range(taxi_env.num_taxis)]
-        self.env_graph = EnvGraph(taxi_env.desc.astype(str))
+        self.env_graph = env_graph if env_graph is not None else EnvGraph.for_desc(taxi_env.desc)
+        self.env_graph.all_pairs()
 
     def get_passenger_cors(self, passenger_index):
         """
@@ -26,20 +27,22 @@ class Controller:
 
     def get_next_step(self):
         """
-        Returns the next step of all taxis that should be passed to the environment.
+        Returns the next step of all taxis that should be passed to the environment. The returned dictionary is empty
+        if all taxis completed all their steps.
         """
-        # Check that not all taxis completed all steps:
-        if self.any_actions_left():
-            taxis_step = {f'taxi_{taxi.taxi_index+1}': taxi.get_next_step() for taxi in self.taxis}
-            taxis_step = {item[0]: item[1] for item in taxis_step.items() if item[1] is not None}
-            return taxis_step
+        taxis_step = {}
+        for taxi in self.taxis:
+            step = taxi.get_next_step()
+            if step is not None:
+                taxis_step[taxi.step_key] = step
+        return taxis_step
 
     def any_actions_left(self):
         """
         Check if not all taxis completed their paths.
         Return `True` if not all taxis completed their path and `False` if some taxi still has steps to do.
         """
-        return any([taxi.actions_queue for taxi in self.taxis])
+        return any(taxi.actions_queue for taxi in self.taxis)
 
     def execute_all_actions(self):
         """
@@ -82,33 +85,27 @@ class Controller:
         Return:
               The point that will cause the to_taxi to make the smallest possible detour.
         """
+        from_taxi = self.taxis[from_taxi_index]
+        to_taxi = self.taxis[to_taxi_index]
+
         # Compute the shortest path of the `to_taxi_index` taxi to the destination of the passenger.
-        path_cords, path_actions = self.taxis[to_taxi_index].compute_shortest_path(dest=self.get_destination_cors(passenger_index))
+        path_cords, path_actions = to_taxi.compute_shortest_path(dest=self.get_destination_cors(passenger_index))
         to_taxi_shortest_path = path_cords
         # Add the current location of the taxi as another optional transfer point:
-        to_taxi_shortest_path.insert(0, self.taxis[to_taxi_index].get_location())
+        to_taxi_shortest_path.insert(0, to_taxi.get_location())
 
         # -1 to avoid consuming all the `from_taxi` fuel as it will not be able to make the dropoff
         from_taxi_remaining_fuel = self.taxi_env.state[FUELS][from_taxi_index] - 1
 
         # A list of tuples where the first item is the off-road distance the `to_taxi` will have to take from the
-        # shortest computed path to the closest point the `from_taxi` can get. The second item is the furthest point
-        # that the `from_taxi` can get to, based on its fuel limitations.
-        off_road_distances = []
-        for point in to_taxi_shortest_path:
-            path_cords, path_actions = self.taxis[from_taxi_index].compute_shortest_path(dest=point)
-            # Add the current location of the taxi for cases where the taxi has no fuel to move:
-            path_cords.insert(0, self.taxis[from_taxi_index].get_location())
-            # Compute how many steps of the path the taxi can't complete because of its fuel limit:
-            remaining_path = max(0, len(path_actions) - from_taxi_remaining_fuel)
-            if remaining_path > 0:
-                off_road_distances.append((remaining_path, path_cords[min(from_taxi_remaining_fuel, len(path_actions))]))
-            else:
-                off_road_distances.append((0, point))
+        # shortest computed path to the closest point the `from_taxi` can get. The second item is the node of the
+        # furthest point that the `from_taxi` can get to, based on its fuel limitations. Points are kept as node
+        # indices, and only the selected point is converted back to coordinates.
+        off_road_distances = from_taxi.truncated_candidates(to_taxi_shortest_path, from_taxi_remaining_fuel)
 
         # Select the optimal point (the one with minimal off-road steps for `to_taxi`):
-        optimal_point = min(off_road_distances, key=lambda x: x[0])[1]
-        return optimal_point
+        optimal_node = min(off_road_distances, key=lambda x: x[0])[1]
+        return from_taxi.env_graph.node_to_cors(optimal_node)
 
     def find_transfer_point_h2(self, from_taxi_index, passenger_index):
         """
@@ -138,34 +135,28 @@ class Controller:
         Return:
             The optimal point to make the transfer at.
         """
-        best_transfer_point = []
-        min_dist_from_dest = np.inf
         from_taxi = self.taxis[from_taxi_index]
         to_taxi = self.taxis[to_taxi_index]
-        passenger_destination = self.get_destination_cors(passenger_index)
-        for row in range(self.env_graph.rows):
-            for col in range(self.env_graph.cols):
-                transfer_point = [row, col]
-
-                # check if the from_taxi has enough fuel to reach the transfer point, if not continue
-                path_to_point_cost = from_taxi.path_cost(dest=transfer_point)
-                if path_to_point_cost > from_taxi.get_fuel() - 1:
-                    continue
-                else:
-                    # check if the to_taxi has enough fuel to reach the transfer point, if not compute the dist to dest
-                    path_to_point_cost = to_taxi.path_cost(dest=transfer_point)
-                    if path_to_point_cost > to_taxi.get_fuel() - 1:
-                        dist_from_dest = from_taxi.path_cost(dest=passenger_destination, origin=transfer_point)
-                    else:
-                        total_path_cost = path_to_point_cost + to_taxi.path_cost(origin=transfer_point,
-                                                                                 dest=passenger_destination)
-                        dist_from_dest = max(0, total_path_cost - (to_taxi.get_fuel() - 1))
-
-                    # Check if this transfer point is better than the current transfer point:
-                    if dist_from_dest < min_dist_from_dest:
-                        min_dist_from_dest = dist_from_dest
-                        best_transfer_point = transfer_point
-        return best_transfer_point
+        distances = self.env_graph.all_pairs()
+        destination_node = self.env_graph.cors_to_node(*self.get_destination_cors(passenger_index))
+        from_taxi_costs = distances[self.env_graph.cors_to_node(*from_taxi.get_location())].astype(int)
+        to_taxi_costs = distances[self.env_graph.cors_to_node(*to_taxi.get_location())].astype(int)
+        to_dest_costs = distances[:, destination_node].astype(int)
+
+        # Points the from_taxi can reach while keeping one unit of fuel for the dropoff:
+        reachable = from_taxi_costs <= from_taxi.get_fuel() - 1
+        if not reachable.any():
+            return []
+
+        # If the to_taxi can reach the transfer point it continues towards the destination with its remaining fuel,
+        # otherwise the passenger stays at the transfer point:
+        to_taxi_fuel = to_taxi.get_fuel() - 1
+        dist_from_dest = np.where(to_taxi_costs <= to_taxi_fuel,
+                                  np.maximum(0, to_taxi_costs + to_dest_costs - to_taxi_fuel), to_dest_costs)
+        dist_from_dest[~reachable] = np.iinfo(dist_from_dest.dtype).max
+
+        # argmin returns the first minimum, i.e. the first best point in row-major order:
+        return self.env_graph.node_to_cors(int(dist_from_dest.argmin()))
 
     def find_closest_taxi(self, dest: List[int]):
         """
@@ -187,8 +178,10 @@ class Controller:
         Allocate all passengers to the taxis based on the distance of every taxi from the passenger.
         """
         for i in range(self.taxi_env.num_passengers):
-            costs = [taxi.pickup_cost(passenger_index=i) for taxi in self.taxis]
-            assigned_taxi = costs.index(min(costs))
+            passenger_distances = self.env_graph.single_source(self.taxi_env.state[PASSENGERS_START_LOCATION][i])
+            assigned_taxi = min(range(len(self.taxis)),
+                                key=lambda j: self.taxis[j].pickup_cost(passenger_index=i,
+                                                                        passenger_distances=passenger_distances))
             self.taxis[assigned_taxi].assigned_passengers.append(i)
 
     def pickup_passengers(self):
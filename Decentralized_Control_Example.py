@@ -23,8 +23,11 @@ def decentralized_control(num_taxis: int, num_passengers: int, max_fuel: List[in
 
     # For every taxi, broadcast its cost to every passenger:
     for i in range(num_passengers):
+        # The distances of all points from the passenger, shared by all taxis to compute their pickup cost:
+        passenger_distances = all_taxis[0].env_graph.single_source(env.state[PASSENGERS_START_LOCATION][i])
         for taxi in all_taxis:
-            [all_taxis[j].listen(message=taxi.passenger_allocation_message(passenger_index=i))
+            [all_taxis[j].listen(message=taxi.passenger_allocation_message(passenger_index=i,
+                                                                           passenger_distances=passenger_distances))
              for j in range(num_taxis)]
 
         # Let taxis decide on passenger's i allocation:
@@ -64,8 +67,7 @@ def decentralized_control(num_taxis: int, num_passengers: int, max_fuel: List[in
 
     # Pickup the passenger and bring her to the destination:
     for taxi in all_taxis:
-        taxi.send_taxi_to_pickup()
-        taxi.send_taxi_to_dropoff()
+        taxi.plan_trip()
 
     # Execute the actions of all taxis:
     execute_all_actions(taxi_env=env, taxis=all_taxis)
@@ -1,16 +1,62 @@
 import networkx as nx
 import numpy as np
+from collections import deque
+from functools import lru_cache
 from typing import Tuple, List
 
+try:
+    from numba import njit
+except ImportError:  # Numba is optional, without it the graph kernels below run as plain Python functions.
+    def njit(*args, **kwargs):
+        return lambda func: func
+
 TAXIS_LOCATIONS, FUELS, PASSENGERS_START_LOCATION, PASSENGERS_DESTINATIONS, PASSENGERS_STATUS = 0, 1, 2, 3, 4
 
+# Distance of nodes that can't be reached, the maximal value of the int16 distance arrays:
+UNREACHABLE = int(np.iinfo(np.int16).max)
+
+# Layout of the messages broadcast by `Taxi.passenger_allocation_message`:
+PASSENGER_ALLOCATION_MESSAGE = np.dtype([('taxi_index', np.int32), ('passenger_index', np.int32),
+                                         ('pickup_cost', np.int32)])
+
+
+@njit(cache=True)
+def _bfs(neighbors, source):
+    """
+    BFS from the `source` node to all nodes of a graph given by its `neighbors` array (see `EnvGraph`).
+    Returns the distance of every node from the source and the predecessor of every node on its shortest path.
+    """
+    num_nodes = neighbors.shape[0]
+    distances = np.full(num_nodes, UNREACHABLE, dtype=np.int32)
+    predecessors = np.full(num_nodes, -1, dtype=np.int32)
+    queue = np.empty(num_nodes, dtype=np.int32)
+    distances[source] = 0
+    queue[0] = source
+    head, tail = 0, 1
+    while head < tail:
+        node = queue[head]
+        head += 1
+        for neighbor in neighbors[node]:
+            if neighbor != -1 and distances[neighbor] == UNREACHABLE:
+                distances[neighbor] = distances[node] + 1
+                predecessors[neighbor] = node
+                queue[tail] = neighbor
+                tail += 1
+    return distances, predecessors
+
 
 class EnvGraph:
     """
-    This class converts the map of the taxi-world into a Networkx graph.
+    This class converts the map of the taxi-world into a graph.
     Each square in the map is represented by a node in the graph. The nodes are indexed by rows, i.e. for a 4-row by
     5-column grid, node in location [0, 2] (row-0, column-2) has index 2 and node in location [1,1] has index 6.
+    The graph is held as a `neighbors` array of shape (nodes, 4), where `neighbors[i, a]` is the node reached from
+    node i by the movement action a (0-south, 1-north, 2-east, 3-west) or -1 if there is a wall in that direction.
+    A Networkx representation of the graph is available through `get_nx`.
     """
+    # Graphs created by `for_desc`, keyed by the content of their map:
+    _instances = {}
+
     def __init__(self, desc: list):
         """
         Args:
@@ -18,14 +64,49 @@ class EnvGraph:
         """
         self.rows = len(desc) - 2
         self.cols = len(desc[0]) // 2
-        self.graph = nx.empty_graph(self.rows * self.cols)
-        for i in self.graph.nodes:
-            row, col = self.node_to_cors(i)
-            if desc[row + 2][col * 2 + 1] != '-':  # Check south
-                self.graph.add_edge(i, self.cors_to_node(row + 1, col))
-                # In case we ever use horizontal barriers
-            if desc[row + 1][col * 2 + 2] == ':':  # Check east
-                self.graph.add_edge(i, self.cors_to_node(row, col + 1))
+        # The movement action between two neighbouring nodes, by the difference of their indices:
+        self._delta_action = {-1: 3, 1: 2, -self.cols: 1, self.cols: 0}  # West, East, North, South
+        num_nodes = self.rows * self.cols
+        self.neighbors = np.full((num_nodes, 4), -1, dtype=np.int32)
+        # The characters south and east of every square, as (rows, cols) grids ordered like the nodes:
+        chars = np.array([list(line) for line in desc], dtype='U1')
+        south_open = np.flatnonzero(chars[2:, 1::2] != '-')  # In case we ever use horizontal barriers
+        east_open = np.flatnonzero(chars[1:-1, 2::2] == ':')
+        self.neighbors[south_open, 0] = south_open + self.cols
+        self.neighbors[south_open + self.cols, 1] = south_open
+        self.neighbors[east_open, 2] = east_open + 1
+        self.neighbors[east_open + 1, 3] = east_open
+
+        # The Networkx graph, built on first use (see `get_nx`).
+        self._nx_graph = None
+
+        # Shortest paths between pairs of nodes. The map is static, so cached paths never go stale:
+        self._cached_path = lru_cache(maxsize=8192)(self._compute_path)
+
+        # All-pairs shortest paths tables indexed by node, built on first use (see `_build_apsp`).
+        self.D = None
+        self.next_hop = None
+
+    @classmethod
+    def for_desc(cls, desc: np.ndarray) -> 'EnvGraph':
+        """
+        Returns the graph of the given map description (the `desc` attribute of a TaxiEnv). A single graph is created
+        for every map, so all taxis and environments with the same map share it, and it should not be modified.
+        """
+        key = (desc.tobytes(), desc.shape)
+        if key not in cls._instances:
+            cls._instances[key] = cls(desc.astype(str))
+        return cls._instances[key]
+
+    def _edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the source and target nodes of all edges in the graph, each edge once. The edges are ordered by their
+        source node, with the south edge of every node before its east edge, which is the order in which the Networkx
+        graph has always been built. The Networkx shortest path between two nodes depends on this order.
+        """
+        targets = self.neighbors[:, [0, 2]].ravel()  # South, East
+        sources = np.repeat(np.arange(self.rows * self.cols), 2)
+        return sources[targets != -1], targets[targets != -1]
 
     def node_to_cors(self, node) -> List:
         """
@@ -39,33 +120,91 @@ class EnvGraph:
         """
         return row * self.cols + col
 
-    def get_path(self, origin: (int, int), target: (int, int)) -> Tuple[list, list]:
+    def get_path(self, origin: (int, int), target: (int, int)) -> Tuple[tuple, tuple]:
         """
         Computes the shortest path in the graph from the given origin point to the given target point.
-        Returns a tuple of lists where the first list represents the coordinates of the nodes that are along the path,
-        and the second list represent the actions that should be taken to make the shortest path.
+        Returns a tuple of tuples where the first tuple represents the coordinates of the nodes that are along the path,
+        and the second tuple represent the actions that should be taken to make the shortest path.
+        Paths are cached, so the returned tuples are shared between callers and should be copied before modifying them.
         """
-        node_origin, node_target = self.cors_to_node(*origin), self.cors_to_node(*target)
-        if node_origin == node_target:
-            return [], []
+        cols = self.cols
+        return self._cached_path(origin[0] * cols + origin[1], target[0] * cols + target[1])
 
-        path = nx.shortest_path(self.graph, node_origin, node_target)
-        cord_path = [self.node_to_cors(node) for node in path]
-        actions = []
-        for node in range(len(path) - 1):
-            delta = path[node + 1] - path[node]
-            if delta == -1:  # West
-                actions.append(3)
-            elif delta == 1:  # East
-                actions.append(2)
-            elif delta == -self.cols:  # North
-                actions.append(1)
-            else:  # South
-                actions.append(0)
-        return cord_path[1:], actions
+    def _compute_path(self, node_origin: int, node_target: int) -> Tuple[tuple, tuple]:
+        """
+        Computes the shortest path between two nodes, see `get_path`.
+        """
+        distances = self.all_pairs()
+        if node_origin == node_target or distances[node_origin, node_target] == UNREACHABLE:
+            return (), ()
+
+        # There are usually several shortest paths between two nodes. The path is chosen by Networkx, as it always has
+        # been, since the transfer heuristics follow the chosen paths and their results depend on it:
+        path = nx.shortest_path(self.get_nx(), node_origin, node_target)
+        delta_action, cols = self._delta_action, self.cols
+        # Convert all nodes of the path (except the origin) to coordinates at once:
+        cord_path = np.stack(np.divmod(np.array(path[1:]), cols), axis=1).tolist()
+        actions = [delta_action[path[node + 1] - path[node]] for node in range(len(path) - 1)]
+        return tuple(cord_path), tuple(actions)
+
+    def bfs(self, origin: (int, int)) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the result of a BFS from the given origin point to all nodes in the graph, read from the all-pairs
+        tables. Returns a tuple of int16 arrays indexed by node: the distance of every node from the origin, and the
+        predecessor of every node on its shortest path from the origin (-1 for the origin itself and for unreachable
+        nodes). Unreachable nodes have the maximal int16 value as their distance.
+        """
+        source = self.cors_to_node(*origin)
+        # The predecessor of a node on the path from the origin is its next hop on the path back to the origin:
+        return self.all_pairs()[source], self.next_hop[:, source]
 
     def get_nx(self) -> nx.Graph:
-        return self.graph.copy()
+        """
+        Returns the graph as a Networkx graph. The Networkx graph is built on the first call.
+        The returned graph is shared by all callers and frozen, so it can't be modified. Callers that need to modify it
+        should make their own copy (e.g. `nx.Graph(graph)`).
+        """
+        if self._nx_graph is None:
+            self._nx_graph = nx.empty_graph(self.rows * self.cols)
+            self._nx_graph.add_edges_from(zip(*(nodes.tolist() for nodes in self._edges())))
+            nx.freeze(self._nx_graph)
+        return self._nx_graph
+
+    def _build_apsp(self):
+        """
+        Computes the shortest paths between every pair of nodes, with a BFS from every node. The results are stored in
+        two int16 matrices indexed by node:
+            - `self.D`, where `D[i, j]` is the distance from node i to node j (the maximal int16 value if unreachable).
+            - `self.next_hop`, where `next_hop[i, j]` is the node following node i on the shortest path from i to j
+              (-1 if i == j or if j is unreachable).
+        """
+        num_nodes = self.rows * self.cols
+        # Node indices (and distances, which are smaller than the number of nodes) must fit in the int16 tables, below
+        # the value reserved for unreachable nodes:
+        if num_nodes > UNREACHABLE:
+            raise ValueError(f'Maps with more than {UNREACHABLE} squares are not supported, got {num_nodes} squares')
+        self.D = np.empty((num_nodes, num_nodes), dtype=np.int16)
+        self.next_hop = np.empty((num_nodes, num_nodes), dtype=np.int16)
+        for node in range(num_nodes):
+            distances, predecessors = _bfs(self.neighbors, node)
+            self.D[node] = distances
+            # The predecessor of every node in the BFS from `node` is its next hop on the shortest path to `node`:
+            self.next_hop[:, node] = predecessors
+
+    def all_pairs(self) -> np.ndarray:
+        """
+        Returns the all-pairs distance matrix of the graph (see `_build_apsp`), building it if needed.
+        """
+        if self.D is None:
+            self._build_apsp()
+        return self.D
+
+    def single_source(self, src) -> np.ndarray:
+        """
+        Returns an int16 array, indexed by node, with the distance of every node from the given source point.
+        As the graph is undirected, this is also the distance of every node to the source point.
+        """
+        return self.all_pairs()[self.cors_to_node(*src)]
 
     def path_cost(self, origin, dest):
         """
@@ -76,20 +215,26 @@ class EnvGraph:
         Returns:
         The cost of a path between two points.
         """
-        return len(self.get_path(origin, dest)[1])
+        return int(self.all_pairs()[origin[0] * self.cols + origin[1], dest[0] * self.cols + dest[1]])
 
 
 class Taxi:
     """
     Taxi wrapper for a single taxi object.
     """
-    def __init__(self, taxi_env, taxi_index, assigned_passengers=None):
+    def __init__(self, taxi_env, taxi_index, assigned_passengers=None, env_graph: EnvGraph = None):
         self.taxi_env = taxi_env
         self.taxi_index = taxi_index
-        self.env_graph = EnvGraph(taxi_env.desc.astype(str))
+        # The name of the taxi in the environment's action dictionary:
+        self.step_key = f'taxi_{taxi_index + 1}'
+        self.env_graph = env_graph if env_graph is not None else EnvGraph.for_desc(taxi_env.desc)
         self.communication_channel = []
-        self.actions_queue = []
-        self.assigned_passengers = assigned_passengers if assigned_passengers else []
+        self.actions_queue = deque()
+        self.assigned_passengers = deque(assigned_passengers) if assigned_passengers else deque()
+        # The indices of the pickup action and of the dropoff action of every passenger:
+        self._pickup_action = taxi_env.action_index_dictionary['pickup']
+        self._dropoff_actions = [taxi_env.action_index_dictionary[f'dropoff{passenger_index}']
+                                 for passenger_index in range(taxi_env.num_passengers)]
 
     def compute_shortest_path(self, dest: list, origin: list = None):
         """
@@ -102,14 +247,22 @@ class Taxi:
         env_state = self.taxi_env.state
         origin = origin if origin is not None else env_state[TAXIS_LOCATIONS][self.taxi_index]
         cord_path, actions = self.env_graph.get_path(origin, dest)
-        return cord_path, actions
+        # Callers may modify the returned lists, so return copies of the cached path:
+        return list(cord_path), list(actions)
+
+    def bfs_from_here(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Runs a BFS from the current location of the taxi to all points on the grid.
+        Returns the distances and predecessors arrays computed by `EnvGraph.bfs`.
+        """
+        return self.env_graph.bfs(self.get_location())
 
     def get_next_step(self):
         """
         Gets the next step in the taxi's action-queue.
         """
         if self.actions_queue:
-            next_action = self.actions_queue.pop(0)
+            next_action = self.actions_queue.popleft()
             return next_action
 
     def get_location(self):
@@ -118,6 +271,12 @@ class Taxi:
         """
         return self.taxi_env.state[TAXIS_LOCATIONS][self.taxi_index]
 
+    def get_location_flat(self):
+        """
+        Returns the index of the node in the graph that corresponds to the current location of the taxi.
+        """
+        return self.env_graph.cors_to_node(*self.get_location())
+
     def get_fuel(self):
         """
         Returns the current fuel state of the taxi.
@@ -130,8 +289,7 @@ class Taxi:
         destination point.
         """
         origin = origin if origin else self.taxi_env.state[TAXIS_LOCATIONS][self.taxi_index]
-        _, actions = self.env_graph.get_path(origin, dest)
-        return len(actions)
+        return self.env_graph.path_cost(origin, dest)
 
     def send_taxi_to_point(self, point):
         """
@@ -157,7 +315,7 @@ class Taxi:
         self.send_taxi_to_point(point=passenger_location)
 
         # Add a `pickup` action:
-        self.actions_queue.extend([(self.taxi_env.action_index_dictionary['pickup'])])
+        self.actions_queue.append(self._pickup_action)
 
     def send_taxi_to_dropoff(self, point=None):
         """
@@ -173,47 +331,80 @@ class Taxi:
         self.send_taxi_to_point(point=destination)
 
         # Add a `dropoff` action:
-        self.actions_queue.extend([self.taxi_env.action_index_dictionary[f'dropoff{self.assigned_passengers[0]}']])
-        self.assigned_passengers.pop(0)
+        self.actions_queue.append(self._dropoff_actions[self.assigned_passengers[0]])
+        self.assigned_passengers.popleft()
+
+    def plan_trip(self, pickup_loc=None, dropoff_loc=None):
+        """
+        Sends the taxi to pickup its first assigned passenger and to drop her off. Unlike calling `send_taxi_to_pickup`
+        and then `send_taxi_to_dropoff`, the path to the dropoff point starts at the pickup point, where the taxi will
+        be after the pickup, and not at the current location of the taxi.
+        Adds all steps of both paths, and the pickup and dropoff actions, to the actions queue of the taxi.
+        Args:
+            pickup_loc (optional): the location to pickup the passenger from. If not specified, the passenger will be
+            picked up from her current location.
+            dropoff_loc (optional): the point at which to dropoff the passenger. If not specified, the passenger will be
+            dropped off at her destination.
+        """
+        if not self.assigned_passengers:
+            return
+        passenger_index = self.assigned_passengers[0]
+        env_state = self.taxi_env.state
+        pickup_loc = pickup_loc if pickup_loc else env_state[PASSENGERS_START_LOCATION][passenger_index]
+        dropoff_loc = dropoff_loc if dropoff_loc else env_state[PASSENGERS_DESTINATIONS][passenger_index]
+
+        self.actions_queue.extend(self.env_graph.get_path(self.get_location(), pickup_loc)[1])
+        self.actions_queue.append(self._pickup_action)
+        self.actions_queue.extend(self.env_graph.get_path(pickup_loc, dropoff_loc)[1])
+        self.actions_queue.append(self._dropoff_actions[passenger_index])
+        self.assigned_passengers.popleft()
 
-    def pickup_cost(self, passenger_index):
+    def pickup_cost(self, passenger_index, passenger_distances: np.ndarray = None):
         """
         Calculates the cost of the taxi to pickup the given passenger. The taxi calculates the cost from its current
         location if it has no allocated passengers, else from the location of the last allocated passenger.
+        Args:
+            passenger_index: the index of the passenger to pickup.
+            passenger_distances: (optional) the distances of all points from the passenger's location, as returned by
+                `EnvGraph.single_source`. When computing the cost of all taxis to the same passenger, pass them to read
+                the cost from it instead of querying the graph for every taxi.
         """
-        passenger_location = self.taxi_env.state[PASSENGERS_START_LOCATION][passenger_index]
-        origin = None
+        env_state = self.taxi_env.state
+        passengers_start = env_state[PASSENGERS_START_LOCATION]
+        passenger_location = passengers_start[passenger_index]
+        origin = env_state[TAXIS_LOCATIONS][self.taxi_index]
         # Check if the taxi has an allocated passenger. If yes, compute the cost from this passenger's location:
         if self.assigned_passengers:
-            origin = self.taxi_env.state[PASSENGERS_START_LOCATION][self.assigned_passengers[-1]]
+            origin = passengers_start[self.assigned_passengers[-1]]
 
+        if passenger_distances is not None:
+            return int(passenger_distances[self.env_graph.cors_to_node(*origin)])
         pickup_cost = self.path_cost(dest=passenger_location, origin=origin)
         return pickup_cost
 
-    def passenger_allocation_message(self, passenger_index):
+    def passenger_allocation_message(self, passenger_index, passenger_distances: np.ndarray = None):
         """
         Broadcast a message with information about the cost of the path to a specific passenger and the shortest
         path from the taxi's current location to the destination of the passenger.
+        The optional `passenger_distances` are passed on to `pickup_cost`.
+        The message is a single record of a `PASSENGER_ALLOCATION_MESSAGE` array.
         """
-        pickup_cost = self.pickup_cost(passenger_index)
-        message = {
-            'taxi_index': self.taxi_index,
-            'passenger_index': passenger_index,
-            'pickup_cost': pickup_cost
-        }
-        return [message]
+        pickup_cost = self.pickup_cost(passenger_index, passenger_distances=passenger_distances)
+        return np.array([(self.taxi_index, passenger_index, pickup_cost)], dtype=PASSENGER_ALLOCATION_MESSAGE)
 
     def request_help_message(self):
         """
         Broadcast a message to all taxis, requesting for help to bring the assigned taxi to the destination.
         """
         all_messages = []
+        passengers_destinations = self.taxi_env.state[PASSENGERS_DESTINATIONS]
+        fuel = self.get_fuel()
         for passenger_index in self.assigned_passengers:
-            passenger_destination = self.taxi_env.state[PASSENGERS_DESTINATIONS][passenger_index]
+            passenger_destination = passengers_destinations[passenger_index]
             path_cost = self.path_cost(dest=passenger_destination)
 
             # Request for help if the taxi hasn't enough fuel:
-            if path_cost >= self.get_fuel():
+            if path_cost >= fuel:
                 message = {
                     'type': 'help_request',
                     'taxi_index': self.taxi_index,
@@ -228,13 +419,15 @@ class Taxi:
         """
         all_messages = []
         communication_channel = []
+        passengers_destinations = self.taxi_env.state[PASSENGERS_DESTINATIONS]
+        fuel = self.get_fuel()
         for incoming_message in self.communication_channel:
             if incoming_message.get('type') != 'help_request':
                 communication_channel.append(incoming_message)
                 continue
             passenger_index = incoming_message.get('passenger_index')
             recipient_taxi_index = incoming_message.get('taxi_index')
-            passenger_destination = self.taxi_env.state[PASSENGERS_DESTINATIONS][passenger_index]
+            passenger_destination = passengers_destinations[passenger_index]
             path_cords, path_actions = self.compute_shortest_path(dest=passenger_destination)
             message = {
                 'type': 'path_response',
@@ -242,7 +435,7 @@ class Taxi:
                 'passenger_index': passenger_index,
                 'shortest_path': path_cords,
                 'recipient_taxi_index': recipient_taxi_index,
-                'taxi_fuel': self.get_fuel()
+                'taxi_fuel': fuel
             }
             all_messages.append(message)
 
@@ -256,17 +449,12 @@ class Taxi:
         Go over all messages and check which taxi is the closest to every passenger. The taxi assigns to itself the
         passengers that are closest to it.
         """
-        pickup_cost = np.inf
-        assigned_taxi = -1
-        for message in self.communication_channel:
-            passenger_index = message['passenger_index']
-            taxi_index = message['taxi_index']
-            if message['pickup_cost'] < pickup_cost:
-                pickup_cost = message['pickup_cost']
-                assigned_taxi = taxi_index
-
-        if assigned_taxi == self.taxi_index:
-            self.assigned_passengers.append(passenger_index)
+        if self.communication_channel:
+            messages = np.array(self.communication_channel, dtype=PASSENGER_ALLOCATION_MESSAGE)
+            # The first taxi with the minimal cost gets the passenger:
+            closest = messages['pickup_cost'].argmin()
+            if messages['taxi_index'][closest] == self.taxi_index:
+                self.assigned_passengers.append(int(messages['passenger_index'][closest]))
 
         # Clear the communication channel:
         self.communication_channel = []
@@ -275,16 +463,19 @@ class Taxi:
         """
         Send the taxi to pickup every passenger that is assigned to it.
         """
-        origin = self.get_location()
-        for passenger in self.assigned_passengers:
-            passenger_location = self.taxi_env.state[PASSENGERS_START_LOCATION][passenger]
-            path_cords, path_actions = self.compute_shortest_path(dest=passenger_location, origin=origin)
-            self.actions_queue.extend(path_actions)
+        passengers_start = self.taxi_env.state[PASSENGERS_START_LOCATION]
+        # The route of the taxi, from its current location through the locations of all its passengers:
+        route = [self.get_location()] + [passengers_start[passenger] for passenger in self.assigned_passengers]
+        actions = []
+        for origin, passenger_location in zip(route, route[1:]):
+            # Passengers waiting at the same location are picked up without moving:
+            if origin != passenger_location:
+                actions.extend(self.env_graph.get_path(origin, passenger_location)[1])
 
             # Add pickup step
-            self.actions_queue.append(self.taxi_env.action_index_dictionary['pickup'])
+            actions.append(self._pickup_action)
 
-            origin = passenger_location
+        self.actions_queue.extend(actions)
 
     def listen(self, message):
         """
@@ -301,9 +492,10 @@ class Taxi:
             return
 
         helping_taxi_index = self.taxi_index
-        remaining_dist_to_dest = self.path_cost(dest=self.taxi_env.state[PASSENGERS_DESTINATIONS][
-            self.assigned_passengers[0]]) - self.get_fuel()
         transfer_point = self.taxi_env.state[PASSENGERS_DESTINATIONS][self.assigned_passengers[0]]
+        remaining_dist_to_dest = self.path_cost(dest=transfer_point) - self.get_fuel()
+
+        # The offers are checked in order, and every accepted offer narrows the distance bound for the later ones:
         current_cost = np.inf
 
         for message in self.communication_channel:
@@ -338,6 +530,35 @@ class Taxi:
 
             return [transfer_message]
 
+    def truncated_candidates(self, points: List[List[int]], remaining_fuel: int) -> List[Tuple[int, int]]:
+        """
+        For every candidate transfer point in `points` (in order), computes how far the taxi can drive towards it with
+        `remaining_fuel` steps. Returns a list of `(off_road, node)` tuples, where `off_road` is the number of steps of
+        the shortest path to the point the taxi can't complete, and `node` is the node of the furthest point on that
+        path the taxi can get to. The list ends at the first point the taxi can reach, as no later point can need fewer
+        off-road steps.
+        """
+        env_graph = self.env_graph
+        location = self.get_location()
+        distances = env_graph.single_source(location)
+        candidates = []
+        for point in points:
+            point_node = env_graph.cors_to_node(*point)
+            path_cost = int(distances[point_node])
+            # Compute how many steps of the path the taxi can't complete because of its fuel limit:
+            off_road = max(0, path_cost - remaining_fuel)
+            if off_road > 0:
+                # The furthest point the taxi can get to on its shortest path to the point. A taxi with no fuel
+                # (remaining fuel of -1) can't move, so it stays at its own location:
+                steps = max(0, remaining_fuel)
+                furthest_point = env_graph.get_path(location, point)[0][steps - 1] if steps > 0 else location
+                node = env_graph.cors_to_node(*furthest_point)
+                candidates.append((off_road, node))
+            else:
+                candidates.append((0, point_node))
+                break
+        return candidates
+
     def find_best_transfer_point(self, to_taxi_index, passenger_index, path_to_dest, to_taxi_fuel):
         """
         Find the best point to transfer the passenger between the taxis. The best point is considered as the point
@@ -351,30 +572,21 @@ class Taxi:
         Return:
               The optimal point to make the transfer at.
         """
+        env_state = self.taxi_env.state
         # Add the current location of the taxi as another optional transfer point:
-        path_to_dest.insert(0, self.taxi_env.state[TAXIS_LOCATIONS][to_taxi_index])
+        path_to_dest = [env_state[TAXIS_LOCATIONS][to_taxi_index]] + list(path_to_dest)
 
         # -1 to avoid finishing all the `from_taxi` fuel as it will not be able to make the dropoff
-        from_taxi_remaining_fuel = self.taxi_env.state[FUELS][self.taxi_index] - 1
+        from_taxi_remaining_fuel = env_state[FUELS][self.taxi_index] - 1
 
         # A list of tuples where the first item is the off road distance the `to_taxi` will have to take from the
-        # shortest computed path to the closest point the `from_taxi` can get. The second item is the furthest
-        # point that the `from_taxi` can get to, based on its fuel limitations.
-        off_road_distances = []
-        for point in path_to_dest:
-            path_cords, path_actions = self.compute_shortest_path(dest=point)
-            # Add the current location of the taxi for cases where the taxi has no fuel to move:
-            path_cords.insert(0, self.get_location())
-            # Compute how many steps of the path the taxi can't complete because of its fuel limit:
-            remaining_path = max(0, len(path_actions) - from_taxi_remaining_fuel)
-            if remaining_path > 0:
-                off_road_distances.append((remaining_path, path_cords[min(from_taxi_remaining_fuel,
-                                                                          len(path_actions))]))
-            else:
-                off_road_distances.append((0, point))
+        # shortest computed path to the closest point the `from_taxi` can get. The second item is the node of the
+        # furthest point that the `from_taxi` can get to, based on its fuel limitations.
+        off_road_distances = self.truncated_candidates(path_to_dest, from_taxi_remaining_fuel)
 
         # Select the optimal point (the one with minimal off-road steps for `to_taxi`):
-        cost, optimal_point = min(off_road_distances, key=lambda x: x[0])
+        cost, optimal_node = min(off_road_distances, key=lambda x: x[0])
+        optimal_point = self.env_graph.node_to_cors(optimal_node)
 
         # Compute how far from the destination the taxi can bring the passenger:
         distance_from_destination = max(0, cost * 2 + len(path_to_dest) - to_taxi_fuel - 1)  # -1 for the extra step of
@@ -390,3 +602,8 @@ class Taxi:
             self.send_taxi_to_point(point=transfer_point)
             self.assigned_passengers.append(message.get('passenger_index'))
         self.communication_channel = []
+
+
+# Compile the BFS kernel (or load it from Numba's cache) on import, on a single-node graph, so that the first real
+# search doesn't pay for the compilation:
+_bfs(np.full((1, 4), -1, dtype=np.int32), 0)
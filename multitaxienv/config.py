@@ -1,3 +1,5 @@
+import numpy as np
+
 TAXI_ENVIROMENT_REWARDS = dict(
     step=1,
     no_fuel=-20,
@@ -43,6 +45,31 @@ COLOR_MAP = {
             '7': [99, 99, 255],  # Lavender
 }
 
+# COLOR_MAP as a lookup table indexed by the character code of the single character keys. The other keys (passengers
+# and the empty string) are colored by `render_colors` after the lookup:
+COLOR_LUT = np.zeros((256, 3), dtype=np.uint8)
+for _key, _color in COLOR_MAP.items():
+    if len(_key) == 1:
+        COLOR_LUT[ord(_key)] = _color
+MULTICHAR_COLORS = {key: color for key, color in COLOR_MAP.items() if len(key) != 1}
+
+
+def render_colors(np_map: np.array) -> np.array:
+    """
+    Given a numpy ascii map, where every cell is a key of COLOR_MAP - return the rgb color of every cell.
+    """
+    np_map = np.ascontiguousarray(np_map, dtype=str)
+    # Cells without a color raise a KeyError, as looking them up in COLOR_MAP would:
+    unknown_values = np.setdiff1d(np_map, list(COLOR_MAP))
+    if unknown_values.size:
+        raise KeyError(str(unknown_values[0]))
+    # The character codes of every cell, with the first character of every cell at index 0 of the last axis:
+    codes = np_map.view(np.uint32).reshape(np_map.shape + (-1,))
+    rgb_arr = COLOR_LUT[codes[..., 0]]
+    for key, color in MULTICHAR_COLORS.items():
+        rgb_arr[np_map == key] = color
+    return rgb_arr
+
 
 ALL_ACTIONS_NAMES = ['south', 'north', 'east', 'west',
                     'pickup', 'dropoff', 'bind',
@@ -12,7 +12,7 @@ import numpy as np
 import random
 from .config import TAXI_ENVIROMENT_REWARDS, \
     BASE_AVAILABLE_ACTIONS, \
-    ALL_ACTIONS_NAMES, COLOR_MAP
+    ALL_ACTIONS_NAMES, render_colors
 from ray.rllib.env import MultiAgentEnv
 import matplotlib.pyplot as plt
 from gym.spaces import Box, Tuple, Discrete
@@ -256,7 +256,6 @@ class TaxiEnv(MultiAgentEnv):
         """
         if np_map is None:
              np_map = self.get_current_map_with_agents()
-        m, n = np_map.shape[0], np_map.shape[1]
         taxis_locations, _, passengers_start_locations, destinations, passengers_status = self.state
 
         for i, location in enumerate(taxis_locations):
@@ -274,12 +273,7 @@ class TaxiEnv(MultiAgentEnv):
             else:
                 np_map[location[0] + 1, location[1] * 2 + 1] = ' '
 
-        rgb_arr = np.zeros((m, n, 3), dtype=int)
-        for i in range(m):
-            for j in range(n):
-                rgb_arr[i, j] = COLOR_MAP[np_map[i, j]]
-
-        return rgb_arr
+        return render_colors(np_map)
 
     def _get_observation_space_list(self) -> list:
         """